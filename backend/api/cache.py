@@ -0,0 +1,122 @@
+import threading
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+PROCESS_LOCAL_WARNING = (
+    'Кэш хранится в памяти процесса: запущенный сервер не увидит '
+    'изменений, пока не будет перезапущен. Используйте общий кэш '
+    '(CACHE_BACKEND).'
+)
+
+
+def is_process_local():
+    """
+    Кэш виден только текущему процессу,
+    версии, сдвинутые командой manage.py, до сервера не дойдут
+    """
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def get_version(namespace):
+    """
+    Текущая версия пространства имён кэша.
+    Версия - метка времени последнего изменения данных в наносекундах.
+    """
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """
+    Сдвигает версию пространства имён,
+    делая недействительными все построенные на ней ключи
+    """
+    key = f'version:{namespace}'
+    version = max(time.time_ns(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout=None)
+    return version
+
+
+def bump_version_on_commit(namespace):
+    """
+    Сдвигает версию пространства имён после фиксации текущей транзакции.
+    До фиксации другие запросы видят старые данные
+    и не должны сохранить их в кэше под новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def get_or_refresh(key, versions, build, timeout, stale_timeout):
+    """
+    Значение из кэша, построенное для версий versions.
+    Если версии сменились менее stale_timeout секунд назад, а значение
+    уже перестраивает другой запрос, возвращается устаревшее значение.
+    Результат build, равный None, не кэшируется.
+    """
+    entry = cache.get(key)
+    locked = False
+    if entry is not None:
+        entry_versions, value = entry
+        if entry_versions == versions:
+            return value
+        stale_for = time.time_ns() - max(versions)
+        if stale_for < stale_timeout * 10 ** 9:
+            locked = cache.add(f'{key}:lock', True, stale_timeout)
+            if not locked:
+                return value
+    value = build()
+    if value is not None:
+        cache.set(key, (versions, value), timeout)
+    # Блокировку снимает только тот, кто её взял
+    if locked:
+        cache.delete(f'{key}:lock')
+    return value
+
+
+class VersionedLocal:
+    """
+    Значение в памяти процесса, которое строится функцией build
+    и перестраивается при смене версии пространства имён namespace
+    """
+
+    def __init__(self, namespace, build):
+        self.namespace = namespace
+        self.build = build
+        self.version = None
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = get_version(self.namespace)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.value = self.build()
+                    self.version = version
+        return self.value
+
+    def apply(self, change):
+        """
+        Применяет change к значению в памяти и сдвигает версию.
+        Актуальное значение этого процесса изменяется на месте,
+        устаревшее перестроится при следующем обращении.
+        Изменение не передаётся другим процессам: при общем кэше
+        они увидят новую версию и перестроят значение целиком.
+        """
+        with self.lock:
+            up_to_date = (
+                self.value is not None
+                and self.version == get_version(self.namespace)
+            )
+            if up_to_date:
+                change(self.value)
+            version = bump_version(self.namespace)
+            if up_to_date:
+                self.version = version
@@ -0,0 +1,47 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from authentication.models import Subscription, User
+from recipes.models import Favorite, Recipe, ShoppingCartItem
+
+# Счётчик: (модель, поле счётчика, модель связей, поле связи с моделью)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCartItem, 'recipe'),
+    (User, 'subscribers_count', Subscription, 'user'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """
+    Атомарное изменение счётчиков одним запросом на стороне базы данных.
+    Счётчик не уходит ниже нуля, даже если успел разойтись с данными.
+    """
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def reconcile_counters():
+    """
+    Пересчитывает счётчики по связям.
+    Возвращает число исправленных строк для каждого счётчика.
+    """
+    fixed = {}
+    for model, field, related_model, related_field in COUNTERS:
+        actual = Coalesce(Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                count=Count('pk'),
+            ).values('count')
+        ), 0)
+        fixed[f'{model.__name__}.{field}'] = model.objects.annotate(
+            actual=actual,
+        ).exclude(**{field: F('actual')}).update(**{field: actual})
+    return fixed
@@ -0,0 +1,96 @@
+from django.conf import settings
+
+from authentication.models import Subscription
+from recipes.models import FeedItem, Recipe
+
+BATCH_SIZE = 1000
+
+
+def is_large_author(author):
+    return author.subscribers_count > settings.FEED_FANOUT_LIMIT
+
+
+def fan_out(recipe):
+    """
+    Записывает новый рецепт в ленты подписчиков автора.
+    Рецепты авторов с большим числом подписчиков помечаются
+    как неразложенные и добавляются в ленты при чтении.
+    """
+    if is_large_author(recipe.author):
+        recipe.fanned_out = False
+        Recipe.objects.filter(pk=recipe.pk).update(fanned_out=False)
+        return
+    subscriber_ids = Subscription.objects.filter(
+        user_id=recipe.author_id,
+    ).values_list('subscriber_id', flat=True)
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(
+                user_id=subscriber_id,
+                recipe_id=recipe.pk,
+                author_id=recipe.author_id,
+            )
+            for subscriber_id in subscriber_ids.iterator()
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(subscription):
+    """
+    Добавляет в ленту нового подписчика последние рецепты автора.
+    Число строк не зависит от числа подписчиков,
+    поэтому выполняется и для крупных авторов.
+    """
+    recipe_ids = Recipe.objects.filter(
+        author_id=subscription.user_id,
+    ).order_by('-id').values_list('id', flat=True)
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(
+                user_id=subscription.subscriber_id,
+                recipe_id=recipe_id,
+                author_id=subscription.user_id,
+            )
+            for recipe_id in recipe_ids[:settings.FEED_BACKFILL]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove(subscription):
+    """
+    Убирает рецепты автора из ленты бывшего подписчика
+    """
+    FeedItem.objects.filter(
+        user_id=subscription.subscriber_id,
+        author_id=subscription.user_id,
+    ).delete()
+
+
+def get_feed_page(user, before=None, limit=6):
+    """
+    id рецептов страницы ленты по убыванию, не больше limit,
+    с id меньше before (keyset-пагинация).
+    Записи ленты читаются по индексу (user, recipe),
+    неразложенные рецепты авторов из подписок - по частичному индексу
+    (author, id), списки сливаются.
+    """
+    feed_items = FeedItem.objects.filter(user=user)
+    not_fanned_out = Recipe.objects.filter(
+        fanned_out=False,
+        author__in=Subscription.objects.filter(
+            subscriber=user,
+        ).values('user_id'),
+    )
+    if before is not None:
+        feed_items = feed_items.filter(recipe_id__lt=before)
+        not_fanned_out = not_fanned_out.filter(id__lt=before)
+    recipe_ids = set(feed_items.order_by('-recipe_id').values_list(
+        'recipe_id', flat=True,
+    )[:limit])
+    recipe_ids.update(not_fanned_out.order_by('-id').values_list(
+        'id', flat=True,
+    )[:limit])
+    return sorted(recipe_ids, reverse=True)[:limit]
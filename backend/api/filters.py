@@ -1,10 +1,22 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Tag, Ingredient, Recipe
+from recipes.models import Tag, Ingredient, Recipe, TagInRecipe
+from .cache import VersionedLocal
+from .search import search_recipes
 
 User = get_user_model()
 
+tag_ids_by_slug = VersionedLocal(
+    'tags',
+    lambda: dict(Tag.objects.values_list('slug', 'id')),
+)
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in tag_ids_by_slug.get()]
+
 
 class IngredientFilter(filters.FilterSet):
     """
@@ -25,30 +37,60 @@ class RecipeFilter(filters.FilterSet):
         field_name='author',
         queryset=User.objects.all(),
     )
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.OrderingFilter(
+        fields=('favorites_count',),
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов.
+        Одно полусоединение по индексу (tag_id, recipe_id)
+        без дублирования строк рецептов.
+        """
+        tag_ids_map = tag_ids_by_slug.get()
+        tag_ids = [tag_ids_map[slug] for slug in value if slug in tag_ids_map]
+        return queryset.filter(Exists(TagInRecipe.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=tag_ids,
+        )))
+
+    def get_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию, ингредиентам и описанию.
+        Результаты упорядочены по релевантности.
+        """
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        """
+        Сортировка по популярности.
+        id в конце делает порядок однозначным и совпадает
+        с индексом (favorites_count, id).
+        """
+        ordering = value[0]
+        tie_breaker = '-id' if ordering.startswith('-') else 'id'
+        return queryset.order_by(ordering, tie_breaker)
+
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated:
-            if value:
-                return queryset.filter(favorites__user=self.request.user)
-            return queryset.exclude(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=value)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated:
-            if value:
-                return queryset.filter(shopping_cart__user=self.request.user)
-            return queryset.exclude(shopping_cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=value)
         return queryset
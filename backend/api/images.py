@@ -0,0 +1,147 @@
+import base64
+import binascii
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import filetype
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connection, transaction
+from django.utils import timezone
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from PIL import Image
+
+from recipes.models import Recipe
+from .cache import bump_version
+
+# Имя копии: максимальный размер (ширина, высота)
+RENDITIONS = {
+    'thumbnail': (300, 300),
+    'medium': (800, 800),
+}
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'\s+')
+
+Image.init()
+FORMATS = [
+    image_format for image_format in ('avif', 'webp')
+    if f'.{image_format}' in Image.registered_extensions()
+]
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='renditions',
+)
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """
+    Base64ImageField, декодирующий данные кусками во временный файл.
+    Декодированное изображение не держится в памяти целиком,
+    а при сохранении файл перемещается в MEDIA_ROOT без копирования.
+    """
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        if ';base64,' in base64_data:
+            base64_data = base64_data.split(';base64,', 1)[1]
+        upload = TemporaryUploadedFile('image', None, 0, None)
+        try:
+            # Переносы строк (base64.encodebytes, MIME) отбрасываются,
+            # а символы сверх кратного 4 переходят в следующий кусок
+            remainder = ''
+            for start in range(0, len(base64_data), CHUNK_SIZE):
+                chunk = remainder + WHITESPACE.sub(
+                    '', base64_data[start:start + CHUNK_SIZE]
+                )
+                end = len(chunk) - len(chunk) % 4
+                upload.write(base64.b64decode(chunk[:end], validate=True))
+                remainder = chunk[end:]
+            upload.write(base64.b64decode(remainder, validate=True))
+        except (TypeError, binascii.Error, ValueError):
+            upload.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        upload.size = upload.tell()
+        upload.seek(0)
+        extension = filetype.guess_extension(upload.read(8192))
+        upload.seek(0)
+        if extension not in self.ALLOWED_TYPES:
+            upload.close()
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        upload.name = f'{self.get_file_name(None)}.{extension}'
+        return super(Base64FieldMixin, self).to_internal_value(upload)
+
+
+def get_rendition_name(name, rendition, image_format):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{rendition}.{image_format}'
+
+
+def build_renditions(recipe_id, name):
+    """
+    Строит уменьшенные копии изображения рецепта во всех форматах
+    и сохраняет их имена в Recipe.renditions.
+    Если изображение рецепта успело смениться, результат отбрасывается.
+    """
+    try:
+        storage = Recipe._meta.get_field('image').storage
+        renditions = {}
+        with storage.open(name) as file, Image.open(file) as image:
+            image.load()
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            for rendition, size in RENDITIONS.items():
+                resized = image.copy()
+                resized.thumbnail(size)
+                renditions[rendition] = {}
+                for image_format in FORMATS:
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format=image_format)
+                    renditions[rendition][image_format] = storage.save(
+                        get_rendition_name(name, rendition, image_format),
+                        ContentFile(buffer.getvalue()),
+                    )
+        if Recipe.objects.filter(pk=recipe_id, image=name).update(
+            renditions=renditions,
+            updated_at=timezone.now(),
+        ):
+            bump_version('recipes')
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe):
+    """
+    Ставит построение копий в очередь после фиксации транзакции,
+    чтобы поток увидел сохранённый рецепт
+    """
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(build_renditions, recipe_id, name)
+    )
+
+
+def get_rendition_urls(recipe, request=None, names=None):
+    """
+    Ссылки на копии изображения: {копия: {формат: url}}.
+    Пока копии не построены, словарь пуст.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    urls = {}
+    for rendition, formats in recipe.renditions.items():
+        if names is not None and rendition not in names:
+            continue
+        urls[rendition] = {}
+        for image_format, name in formats.items():
+            url = storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[rendition][image_format] = url
+    return urls
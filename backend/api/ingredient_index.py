@@ -0,0 +1,53 @@
+import bisect
+
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient
+from .cache import VersionedLocal
+from .serializers import IngredientSerializer
+
+SEARCH_LIMIT = 50
+
+
+def build_index():
+    """
+    Отсортированные названия в нижнем регистре
+    и заранее сериализованный JSON каждого ингредиента
+    """
+    renderer = JSONRenderer()
+    entries = sorted(
+        (ingredient.name.lower(), ingredient.id,
+         renderer.render(IngredientSerializer(ingredient).data))
+        for ingredient in Ingredient.objects.all()
+    )
+    keys = [key for key, _, _ in entries]
+    items = [item for _, _, item in entries]
+    return keys, items
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для поиска по началу названия.
+    Перестраивается при смене версии 'ingredients',
+    которую сдвигают сигналы модели Ingredient.
+    """
+
+    def __init__(self):
+        self.index = VersionedLocal('ingredients', build_index)
+
+    def search(self, prefix, limit=SEARCH_LIMIT):
+        """
+        JSON-список не более чем limit ингредиентов,
+        название которых начинается с prefix (без учёта регистра)
+        """
+        keys, items = self.index.get()
+        prefix = prefix.lower()
+        start = bisect.bisect_left(keys, prefix)
+        end = start
+        while (end < len(keys) and end - start < limit
+               and keys[end].startswith(prefix)):
+            end += 1
+        return b'[' + b','.join(items[start:end]) + b']'
+
+
+ingredient_index = IngredientIndex()
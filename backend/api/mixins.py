@@ -0,0 +1,216 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import SimpleLazyObject, cached_property
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from authentication.models import Subscription
+from .cache import get_or_refresh, get_version
+
+
+class SubscribedIdsMixin:
+    """
+    Добавляет в контекст сериализаторов множество id авторов,
+    на которых подписан пользователь.
+    Множество загружается один раз за запрос и только при обращении.
+    """
+
+    @cached_property
+    def subscribed_ids(self):
+        user = self.request.user
+        if user.is_anonymous:
+            return set()
+        return set(Subscription.objects.filter(
+            subscriber=user,
+        ).values_list('user_id', flat=True))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['subscribed_ids'] = SimpleLazyObject(
+            lambda: self.subscribed_ids
+        )
+        return context
+
+
+def render_content(view, response):
+    """
+    Байты и Content-Type ответа представления.
+    Ответ DRF рендерится выбранным для запроса рендерером.
+    """
+    if not hasattr(response, 'data'):
+        return response.content, response['Content-Type']
+    request = view.request
+    renderer = request.accepted_renderer
+    content = renderer.render(
+        response.data,
+        request.accepted_media_type,
+        view.get_renderer_context(),
+    )
+    content_type = request.accepted_media_type
+    if renderer.charset:
+        content_type += f'; charset={renderer.charset}'
+    return content, content_type
+
+
+class CachedResponseMixin:
+    """
+    Кэширует готовые байты JSON-ответов list и retrieve
+    и поддерживает условные запросы (ETag/Last-Modified).
+    Ответы становятся недействительными при смене версии cache_namespace,
+    поэтому 304 отдаётся без обращения к базе данных.
+    """
+    cache_namespace = None
+    cache_timeout = 60 * 60 * 24
+
+    def get_cached_response(self, request, handler, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        version = get_version(self.cache_namespace)
+        key = hashlib.md5(
+            f'{self.cache_namespace}:{version}:{request.get_full_path()}'
+            .encode()
+        ).hexdigest()
+        etag = f'"{key}"'
+        last_modified = version // 10 ** 9
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+        )
+        if not_modified is not None:
+            return not_modified
+        cached = cache.get(f'response:{key}')
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = render_content(self, response)
+            cache.set(f'response:{key}', cached, self.cache_timeout)
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin:
+    """
+    Кэш готовых JSON-ответов list для анонимных пользователей.
+    Ключ строится по нормализованным параметрам anonymous_cache_params,
+    запросы с другими параметрами не кэшируются.
+    Ответ устаревает при смене версий anonymous_cache_namespaces,
+    но ещё anonymous_stale_timeout секунд может отдаваться устаревшим,
+    пока один из запросов строит новый (stale-while-revalidate).
+    """
+    anonymous_cache_namespaces = ()
+    anonymous_cache_params = ()
+    anonymous_cache_timeout = 60 * 60
+    anonymous_stale_timeout = 30
+
+    def get_anonymous_cache_key(self, request):
+        params = request.query_params
+        if set(params) - set(self.anonymous_cache_params):
+            return None
+        parts = [self.basename, request.get_host()]
+        for name in self.anonymous_cache_params:
+            values = sorted(set(params.getlist(name)))
+            if values:
+                parts.append(f'{name}={",".join(values)}')
+        key = '&'.join(parts)
+        return 'anonymous:' + hashlib.md5(key.encode()).hexdigest()
+
+    def get_anonymous_cached_response(self, request, handler, *args, **kwargs):
+        key = None
+        if (request.user.is_anonymous
+                and request.accepted_renderer.format == 'json'):
+            key = self.get_anonymous_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+
+        error = None
+
+        def build():
+            nonlocal error
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                error = response
+                return None
+            return (*render_content(self, response), response.get('ETag'))
+
+        versions = tuple(
+            get_version(namespace)
+            for namespace in self.anonymous_cache_namespaces
+        )
+        cached = get_or_refresh(
+            key,
+            versions,
+            build,
+            self.anonymous_cache_timeout,
+            self.anonymous_stale_timeout,
+        )
+        if cached is None:
+            return error
+        content, content_type, etag = cached
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        response = HttpResponse(content, content_type=content_type)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+
+class IdempotencyMixin:
+    """
+    Повтор запроса с тем же заголовком Idempotency-Key
+    возвращает сохранённый ответ первого запроса, не выполняя его снова.
+    Ключ действует в пределах пользователя и действия.
+    """
+    idempotency_timeout = 60 * 60 * 24
+
+    def get_idempotent_response(self, request, handler, *args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return handler(request, *args, **kwargs)
+        key = 'idempotency:' + hashlib.md5(
+            f'{request.user.id}:{self.action}:{request.method}:'
+            f'{idempotency_key}'.encode()
+        ).hexdigest()
+        fingerprint = hashlib.md5(request.body).hexdigest()
+        cached = cache.get(key)
+        if cached is None:
+            if not cache.add(f'{key}:lock', True, 60):
+                return Response(
+                    {"errors": "Запрос с этим ключом ещё выполняется"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            try:
+                response = handler(request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    cached = (fingerprint, response.status_code, response.data)
+                    cache.set(key, cached, self.idempotency_timeout)
+            finally:
+                cache.delete(f'{key}:lock')
+            return response
+        cached_fingerprint, status_code, data = cached
+        if cached_fingerprint != fingerprint:
+            return Response(
+                {"errors": "Ключ уже использован для другого запроса"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = Response(data, status=status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
@@ -1,7 +1,149 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .cache import get_version
+
+COUNT_CACHE_TIMEOUT = 60 * 60
+ESTIMATE_COUNT_THRESHOLD = 100_000
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк таблицы по статистике PostgreSQL.
+    Возвращает None, если оценка неприменима.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < ESTIMATE_COUNT_THRESHOLD:
+        return None
+    return int(row[0])
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, хранящий результат COUNT(*) в кэше под переданным ключом.
+    Для больших таблиц без фильтров использует оценку PostgreSQL.
+    """
+
+    def __init__(self, object_list, per_page, cache_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+
+    @cached_property
+    def count(self):
+        if self.cache_key is None:
+            return self.object_list.count()
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = estimate_count(self.object_list)
+            if count is None:
+                count = self.object_list.count()
+            cache.set(self.cache_key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по убыванию id.
+    Не выполняет COUNT и OFFSET, поэтому глубокие страницы
+    отдаются так же быстро, как первая.
+    """
+    ordering = '-id'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+
+class TrendingCursorPagination(CustomCursorPagination):
+    """
+    Курсорная пагинация оценок популярности по убыванию оценки.
+    Страница читается одним проходом по индексу (score, recipe)
+    без COUNT и OFFSET.
+    """
+    ordering = ('-score', '-recipe_id')
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с параметрами page и limit.
+    При наличии параметра cursor (пустой - первая страница)
+    переключается на курсорную пагинацию.
+
+    Если у представления задан count_cache_namespace, количество объектов
+    кэшируется по набору фильтров и версии этого пространства имён.
+    Фильтры из count_cache_user_filters зависят от пользователя
+    и добавляют в ключ его id и версию указанного пространства имён.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_pagination_class = CustomCursorPagination
+
+    def get_count_cache_key(self, request, view):
+        namespace = getattr(view, 'count_cache_namespace', None)
+        if namespace is None:
+            return None
+        params = request.query_params
+        parts = [namespace, get_version(namespace)]
+        filter_names = sorted(view.filterset_class.base_filters)
+        for name in filter_names:
+            values = sorted(set(params.getlist(name)))
+            if values:
+                parts.append(f'{name}={",".join(values)}')
+        user = request.user
+        user_filters = getattr(view, 'count_cache_user_filters', {})
+        if user.is_authenticated:
+            for name, user_namespace in user_filters.items():
+                if name in params:
+                    user_namespace = f'{user_namespace}:{user.id}'
+                    parts.append(
+                        f'{user_namespace}={get_version(user_namespace)}'
+                    )
+        key = '&'.join(str(part) for part in parts)
+        return 'count:' + hashlib.md5(key.encode()).hexdigest()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            cache_key=self.get_count_cache_key(request, view),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ListPagination(PageNumberPagination):
+    """
+    Постраничная пагинация готового списка с параметрами page и limit
+    """
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 100
@@ -0,0 +1,89 @@
+import bisect
+from array import array
+from collections import Counter
+
+from recipes.models import IngredientInRecipe
+from .cache import VersionedLocal
+
+# Пространство имён версии состава рецептов
+NAMESPACE = 'recipe_ingredients'
+
+
+def build_index():
+    """
+    Инвертированный индекс: id ингредиента -> отсортированный массив id
+    рецептов, и состав каждого рецепта: id рецепта -> кортеж id ингредиентов
+    """
+    postings = {}
+    recipes = {}
+    rows = IngredientInRecipe.objects.order_by(
+        'ingredient_id', 'recipe_id',
+    ).values_list('ingredient_id', 'recipe_id')
+    for ingredient_id, recipe_id in rows.iterator(chunk_size=10_000):
+        if ingredient_id not in postings:
+            postings[ingredient_id] = array('q')
+        postings[ingredient_id].append(recipe_id)
+        recipes[recipe_id] = recipes.get(recipe_id, ()) + (ingredient_id,)
+    return postings, recipes
+
+
+def remove_recipe(index, recipe_id):
+    postings, recipes = index
+    for ingredient_id in recipes.pop(recipe_id, ()):
+        recipe_ids = postings[ingredient_id]
+        position = bisect.bisect_left(recipe_ids, recipe_id)
+        if (position < len(recipe_ids)
+                and recipe_ids[position] == recipe_id):
+            del recipe_ids[position]
+
+
+def set_recipe(index, recipe_id, ingredient_ids):
+    remove_recipe(index, recipe_id)
+    postings, recipes = index
+    recipes[recipe_id] = tuple(ingredient_ids)
+    for ingredient_id in ingredient_ids:
+        recipe_ids = postings.setdefault(ingredient_id, array('q'))
+        recipe_ids.insert(
+            bisect.bisect_left(recipe_ids, recipe_id), recipe_id
+        )
+
+
+class RecipeIngredientIndex:
+    """
+    Индекс состава рецептов в памяти процесса для подбора рецептов
+    по имеющимся ингредиентам.
+    Сериализатор рецептов изменяет индекс на месте, остальные изменения
+    состава сдвигают версию, и индекс перестраивается целиком.
+    На месте изменяется только индекс процесса, сохранившего рецепт,
+    остальные процессы перестраивают свой индекс при следующем запросе.
+    """
+
+    def __init__(self):
+        self.index = VersionedLocal(NAMESPACE, build_index)
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        self.index.apply(
+            lambda index: set_recipe(index, recipe_id, ingredient_ids)
+        )
+
+    def rank(self, ingredient_ids):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов,
+        в виде (id рецепта, доля покрытых ингредиентов) по убыванию доли.
+        При равной доле выше рецепт с большим числом совпадений, затем новый.
+        """
+        postings, recipes = self.index.get()
+        matches = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matches.update(postings.get(ingredient_id, ()))
+        ranked = sorted(
+            (
+                (count / len(recipes[recipe_id]), count, recipe_id)
+                for recipe_id, count in matches.items()
+            ),
+            reverse=True,
+        )
+        return [(recipe_id, coverage) for coverage, _, recipe_id in ranked]
+
+
+recipe_index = RecipeIngredientIndex()
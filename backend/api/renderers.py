@@ -0,0 +1,73 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingCartRendererMixin:
+    """
+    Рендерер списка покупок.
+    Метод stream() отдаёт файл построчно, не собирая его в памяти.
+    """
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        """
+        Принимает итератор кортежей (название, единица, количество)
+        """
+        raise NotImplementedError
+
+    @property
+    def content_type(self):
+        return f'{self.media_type}; charset={self.charset}'
+
+
+class TextShoppingCartRenderer(ShoppingCartRendererMixin, BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+    def stream(self, ingredients):
+        for name, measurement_unit, amount in ingredients:
+            yield f'{name} - {amount}{measurement_unit}\n'
+
+
+class Echo:
+    """
+    Файлоподобный объект для csv.writer, возвращающий записанную строку
+    """
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingCartRenderer(TextShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for name, measurement_unit, amount in ingredients:
+            yield writer.writerow((name, measurement_unit, amount))
+
+
+class JSONShoppingCartRenderer(ShoppingCartRendererMixin, JSONRenderer):
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = ''
+        yield '['
+        for name, measurement_unit, amount in ingredients:
+            yield separator + json.dumps({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']'
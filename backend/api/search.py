@@ -0,0 +1,116 @@
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+
+from recipes.models import IngredientInRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+# Таблица FTS5, заменяющая search_vector на SQLite
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса колонок FTS5 (name, ingredients, text), как A, B, C в PostgreSQL
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def update_search_index(recipe_ids):
+    """
+    Пересчитывает поисковый индекс рецептов по названию,
+    названиям ингредиентов и описанию
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        # Модуль агрегатов PostgreSQL требует psycopg при импорте
+        from django.contrib.postgres.aggregates import StringAgg
+
+        ingredient_names = Subquery(
+            IngredientInRecipe.objects.filter(
+                recipe=OuterRef('pk'),
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' '),
+            ).values('names')
+        )
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=(
+                SearchVector('name', weight='A', config=SEARCH_CONFIG)
+                + SearchVector(
+                    ingredient_names, weight='B', config=SEARCH_CONFIG
+                )
+                + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+            ),
+        )
+    elif connection.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                recipe_ids,
+            )
+            cursor.execute(
+                f'''
+                INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text)
+                SELECT recipe.id, recipe.name, (
+                    SELECT group_concat(ingredient.name, ' ')
+                    FROM recipes_ingredientinrecipe AS item
+                    JOIN recipes_ingredient AS ingredient
+                        ON ingredient.id = item.ingredient_id
+                    WHERE item.recipe_id = recipe.id
+                ), recipe.text
+                FROM recipes_recipe AS recipe
+                WHERE recipe.id IN ({placeholders})
+                ''',
+                recipe_ids,
+            )
+
+
+def delete_from_search_index(recipe_ids):
+    """
+    Удаляет рецепты из таблицы FTS5.
+    В PostgreSQL вектор хранится в строке рецепта и удаляется вместе с ней.
+    """
+    recipe_ids = list(recipe_ids)
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids,
+        )
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, подходящие под поисковый запрос,
+    по убыванию релевантности
+    """
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch',
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-rank', '-id')
+    words = re.findall(r'\w+', query)
+    if not words:
+        return queryset.none()
+    # Слова ищутся как префиксы: морфологии в FTS5 нет
+    match = ' '.join(f'"{word}"*' for word in words)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,),
+    )).annotate(rank=RawSQL(
+        f'''
+        SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s AND rowid = {Recipe._meta.db_table}.id
+        ''',
+        (match,),
+    )).order_by('-rank', '-id')
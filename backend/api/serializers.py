@@ -1,4 +1,5 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
@@ -9,7 +10,17 @@ from recipes.models import (
     Recipe,
     IngredientInRecipe,
     Favorite,
+    TagInRecipe,
 )
+from .images import (
+    StreamingBase64ImageField,
+    get_rendition_urls,
+    schedule_renditions,
+)
+from .recipe_index import recipe_index
+from .search import update_search_index
+from .shopping_cart import invalidate_recipe
+from .signals import bulk_changes
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -33,6 +44,9 @@ class UserSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if user.is_anonymous or user == obj:
             return False
+        subscribed_ids = self.context.get('subscribed_ids')
+        if subscribed_ids is not None:
+            return obj.id in subscribed_ids
         return obj.subscribers.filter(subscriber=user).exists()
 
 
@@ -111,15 +125,27 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = (
+            'updated_at',
+            'search_vector',
+            'favorites_count',
+            'shopping_cart_count',
+            'fanned_out',
+        )
+
+    def get_renditions(self, obj):
+        return get_rendition_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return Favorite.objects.filter(
             user=user,
             recipe=obj,
@@ -129,6 +155,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return obj.shopping_cart.filter(user=user).exists()
 
 
@@ -137,47 +165,157 @@ class RecipeWritableSerializer(RecipeSerializer):
     Сериализатор рецептов для изменения.
     """
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientInRecipeWritableSerializer(many=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
 
-    class Meta:
-        model = Recipe
-        fields = '__all__'
+    class Meta(RecipeSerializer.Meta):
+        pass
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefetched = {}
+
+    def set_prefetched(self, recipe, name, objects):
+        """
+        Сохранение связанных объектов, уже известных после записи,
+        чтобы ответ строился без повторных запросов
+        """
+        if not hasattr(recipe, '_prefetched_objects_cache'):
+            recipe._prefetched_objects_cache = {}
+        recipe._prefetched_objects_cache[name] = objects
+        self.prefetched[name] = objects
 
-    def set_tags_and_ingredients(self, recipe, tags, ingredients):
+    def set_ingredients(self, recipe, ingredients, existing):
         """
-        Установка тегов и ингредиентов.
+        Приведение ингредиентов рецепта к переданному списку.
+        Меняются только отличающиеся строки: новые добавляются,
+        изменённые количества обновляются, лишние удаляются.
+        Возвращает True, если что-то изменилось.
         """
-        if tags:
-            recipe.tags.clear()
-            recipe.tags.set(tags)
-        if ingredients:
-            IngredientInRecipe.objects.filter(recipe=recipe).delete()
-            IngredientInRecipe.objects.bulk_create(
-                [IngredientInRecipe(
+        existing = {item.ingredient_id: item for item in existing}
+        to_create = []
+        to_update = []
+        ingredients_in_recipe = []
+        for ingredient in ingredients:
+            item = existing.pop(ingredient['id'], None)
+            if item is None:
+                item = IngredientInRecipe(
                     recipe=recipe,
-                    ingredient_id=ingredient['id'],
                     amount=ingredient['amount'],
-                ) for ingredient in ingredients]
-            )
+                )
+                to_create.append(item)
+            elif item.amount != ingredient['amount']:
+                item.amount = ingredient['amount']
+                to_update.append(item)
+            item.ingredient = ingredient['ingredient']
+            ingredients_in_recipe.append(item)
+        if existing:
+            # Без сигналов на каждую строку: кэш корзин и updated_at
+            # обновляются один раз после изменения всего рецепта
+            with bulk_changes(IngredientInRecipe):
+                IngredientInRecipe.objects.filter(
+                    pk__in=[item.pk for item in existing.values()]
+                ).delete()
+        IngredientInRecipe.objects.bulk_create(to_create)
+        IngredientInRecipe.objects.bulk_update(to_update, ['amount'])
+        ingredients_in_recipe.sort(key=lambda item: item.pk)
+        self.set_prefetched(
+            recipe, 'ingredientinrecipe_set', ingredients_in_recipe
+        )
+        return bool(existing or to_create or to_update)
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл изображения уже перемещён в хранилище
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    def update_recipe_index(self, recipe, ingredients):
+        """
+        Изменение состава рецепта в индексе подбора по ингредиентам
+        после фиксации транзакции
+        """
+        recipe_id = recipe.pk
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        transaction.on_commit(
+            lambda: recipe_index.set_recipe(recipe_id, ingredient_ids)
+        )
 
     def create(self, validated_data):
-        tags = validated_data.pop('tags', None)
-        ingredients = validated_data.pop('ingredients', None)
-        recipe = Recipe.objects.create(**validated_data)
-        self.set_tags_and_ingredients(recipe, tags, ingredients)
+        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients')
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            TagInRecipe.objects.bulk_create(
+                [TagInRecipe(recipe=recipe, tag=tag) for tag in tags]
+            )
+            self.set_ingredients(recipe, ingredients, existing=[])
+            update_search_index([recipe.pk])
+            self.update_recipe_index(recipe, ingredients)
+            schedule_renditions(recipe)
+        self.set_prefetched(recipe, 'tags', tags)
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
         return recipe
 
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
-        instance = super().update(instance, validated_data)
-        self.set_tags_and_ingredients(instance, tags, ingredients)
+        image = validated_data.pop('image', None)
+        with transaction.atomic():
+            changed = [
+                field for field, value in validated_data.items()
+                if getattr(instance, field) != value
+            ]
+            for field in changed:
+                setattr(instance, field, validated_data[field])
+            if image is not None:
+                # Одинаковые файлы сохраняются под тем же именем,
+                # копии перестраиваются, только если изображение сменилось
+                name = instance.image.name
+                instance.image.save(image.name, image, save=False)
+                if instance.image.name != name:
+                    instance.renditions = {}
+                    changed += ['image', 'renditions']
+                    schedule_renditions(instance)
+            # Рецепт без изменённых полей не сохраняется,
+            # и его updated_at (а с ним ETag) не меняется
+            if changed:
+                instance.save(update_fields=[*changed, 'updated_at'])
+            if tags:
+                # Рецепт обновляется один раз по m2m_changed
+                with bulk_changes(TagInRecipe):
+                    instance.tags.set(tags)
+                self.set_prefetched(instance, 'tags', tags)
+            if ingredients and self.set_ingredients(
+                instance,
+                ingredients,
+                existing=instance.ingredientinrecipe_set.all(),
+            ):
+                invalidate_recipe(instance.pk)
+                Recipe.objects.filter(
+                    pk=instance.pk,
+                ).update(updated_at=timezone.now())
+                update_search_index([instance.pk])
+                self.update_recipe_index(instance, ingredients)
         return instance
 
+    def validate_tags(self, value):
+        tags_by_id = Tag.objects.in_bulk(value)
+        missing_ids = [str(pk) for pk in value if pk not in tags_by_id]
+        if missing_ids:
+            raise ValidationError(
+                'Таких тегов не существует: ' + ', '.join(missing_ids)
+            )
+        return sorted(
+            (tags_by_id[pk] for pk in value),
+            key=lambda tag: tag.id,
+        )
+
     def validate(self, attrs):
         ingredients = attrs.get('ingredients')
         if not ingredients:
@@ -190,8 +328,16 @@ class RecipeWritableSerializer(RecipeSerializer):
                 raise ValidationError(
                     'Количество ингредиента должно быть больше 0'
                 )
-            if not Ingredient.objects.filter(pk=ingredient['id']).exists():
-                raise ValidationError('Такого ингредиента не существует')
+        ingredients_by_id = Ingredient.objects.in_bulk(ingredient_ids)
+        missing_ids = [
+            str(pk) for pk in ingredient_ids if pk not in ingredients_by_id
+        ]
+        if missing_ids:
+            raise ValidationError(
+                'Таких ингредиентов не существует: ' + ', '.join(missing_ids)
+            )
+        for ingredient in ingredients:
+            ingredient['ingredient'] = ingredients_by_id[ingredient['id']]
 
         tags = attrs.get('tags')
         if not tags:
@@ -206,9 +352,13 @@ class RecipeWritableSerializer(RecipeSerializer):
         return attrs
 
     def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return RecipeSerializer(instance, context=context).data
+        """
+        Ответ строится по данным, сохранённым при записи.
+        Новый рецепт не может быть в избранном или в корзине.
+        """
+        for name, objects in self.prefetched.items():
+            self.set_prefetched(instance, name, objects)
+        return RecipeSerializer(instance, context=self.context).data
 
 
 class RecipeInSubscriptionSerializer(serializers.ModelSerializer):
@@ -216,15 +366,43 @@ class RecipeInSubscriptionSerializer(serializers.ModelSerializer):
     Сериализатор рецептов в подписках.
     """
 
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'renditions',
             'cooking_time',
         )
 
+    def get_renditions(self, obj):
+        return get_rendition_urls(
+            obj, self.context.get('request'), names=('thumbnail',)
+        )
+
+
+class CookableRecipeSerializer(RecipeSerializer):
+    """
+    Сериализатор рецептов, подобранных по имеющимся ингредиентам.
+    """
+
+    coverage = serializers.FloatField(read_only=True)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """
+    Список id рецептов для пакетного добавления и удаления.
+    """
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=100,
+    )
+
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     """
@@ -264,15 +442,19 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         """
         Количество рецептов пользователя
         """
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.user.recipes.count()
 
     def get_recipes(self, obj):
         """
         Список рецептов пользователя
         """
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = obj.user.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        recipes = getattr(obj.user, 'recipes_preview', None)
+        if recipes is None:
+            request = self.context.get('request')
+            recipes_limit = request.GET.get('recipes_limit')
+            recipes = obj.user.recipes.all()
+            if recipes_limit:
+                recipes = recipes[:int(recipes_limit)]
         return RecipeInSubscriptionSerializer(recipes, many=True).data
@@ -0,0 +1,135 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientInRecipe, ShoppingCartItem
+from .cache import get_version
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# Сколько секунд список покупок может изменяться одним запросом
+LOCK_TIMEOUT = 30
+
+
+def get_cache_key(user_id):
+    return f'shopping_cart:{get_version("ingredients")}:{user_id}'
+
+
+def lock(key):
+    return cache.add(f'{key}:lock', True, LOCK_TIMEOUT)
+
+
+def unlock(key):
+    """
+    Снимает блокировку списка покупок.
+    Если пока она была занята, список сбрасывали,
+    сохранённый под блокировкой результат удаляется.
+    """
+    if cache.get(f'{key}:stale'):
+        cache.delete_many([key, f'{key}:stale'])
+    cache.delete(f'{key}:lock')
+
+
+def get_recipe_ingredients(recipe_id):
+    return IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id,
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    )
+
+
+def get_shopping_cart(user):
+    """
+    Сводный список покупок пользователя:
+    кортежи (название, единица измерения, количество), отсортированные
+    по названию. Результат агрегации хранится в кэше.
+    """
+    key = get_cache_key(user.id)
+    totals = cache.get(key)
+    if totals is None:
+        locked = lock(key)
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe__shopping_cart__user=user,
+        ).values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+        ).annotate(
+            amount=Sum('amount')
+        )
+        totals = {
+            (name, measurement_unit): amount
+            for name, measurement_unit, amount in ingredients
+        }
+        if locked:
+            cache.set(key, totals, CACHE_TIMEOUT)
+            unlock(key)
+    return [
+        (name, measurement_unit, totals[name, measurement_unit])
+        for name, measurement_unit in sorted(totals)
+    ]
+
+
+def update_shopping_cart(user_id, recipe_id, sign):
+    """
+    Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта
+    из закэшированного списка покупок, не пересчитывая его целиком.
+    Изменение применяется после фиксации транзакции. Если список
+    в это время изменяет другой запрос, он сбрасывается.
+    """
+    def update():
+        key = get_cache_key(user_id)
+        if not lock(key):
+            reset_shopping_cart(user_id)
+            return
+        try:
+            totals = cache.get(key)
+            if totals is None:
+                return
+            ingredients = get_recipe_ingredients(recipe_id)
+            for name, measurement_unit, amount in ingredients:
+                total = totals.get((name, measurement_unit), 0)
+                total += sign * amount
+                if total > 0:
+                    totals[name, measurement_unit] = total
+                else:
+                    totals.pop((name, measurement_unit), None)
+            cache.set(key, totals, CACHE_TIMEOUT)
+        finally:
+            unlock(key)
+
+    transaction.on_commit(update)
+
+
+def invalidate_recipe(recipe_id):
+    """
+    Сбрасывает после фиксации транзакции списки покупок
+    всех пользователей, у которых рецепт лежит в корзине
+    """
+    user_ids = list(ShoppingCartItem.objects.filter(
+        recipe_id=recipe_id,
+    ).values_list('user_id', flat=True))
+    transaction.on_commit(lambda: reset_shopping_carts(user_ids))
+
+
+def reset_shopping_cart(user_id):
+    """
+    Сбрасывает список покупок пользователя,
+    он будет собран заново при следующем скачивании
+    """
+    reset_shopping_carts([user_id])
+
+
+def reset_shopping_carts(user_ids):
+    """
+    Сбрасывает списки покупок пользователей.
+    Список, который в это время пересчитывается или изменяется,
+    помечается устаревшим и не сохранится в кэше.
+    """
+    for user_id in user_ids:
+        key = get_cache_key(user_id)
+        if lock(key):
+            cache.delete_many([key, f'{key}:lock'])
+        else:
+            cache.set(f'{key}:stale', True, LOCK_TIMEOUT)
+            cache.delete(key)
@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.contrib.auth import get_user_model
+from django.dispatch import receiver
+from django.utils import timezone
+
+from authentication.models import Subscription
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCartItem,
+    Tag,
+    TagInRecipe,
+)
+from .cache import bump_version_on_commit
+from .counters import change_counter
+from .feed import backfill, remove
+from .recipe_index import NAMESPACE as RECIPE_INDEX_NAMESPACE
+from .search import delete_from_search_index, update_search_index
+from .shopping_cart import invalidate_recipe, update_shopping_cart
+
+User = get_user_model()
+
+# Модели, сигналы строк которых сейчас не обрабатываются
+muted_models = ContextVar('muted_models', default=frozenset())
+
+
+@contextmanager
+def bulk_changes(*models):
+    """
+    Внутри блока сигналы изменения строк моделей models не обрабатываются:
+    вызывающий код сам обновляет счётчики и кэши один раз на весь пакет
+    """
+    token = muted_models.set(muted_models.get() | set(models))
+    try:
+        yield
+    finally:
+        muted_models.reset(token)
+
+
+@receiver(post_save, sender=ShoppingCartItem)
+def shopping_cart_item_saved(sender, instance, created, **kwargs):
+    if sender in muted_models.get():
+        return
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', 1)
+        update_shopping_cart(instance.user_id, instance.recipe_id, 1)
+    bump_version_on_commit(f'shopping_cart:{instance.user_id}')
+
+
+@receiver(post_delete, sender=ShoppingCartItem)
+def shopping_cart_item_deleted(sender, instance, **kwargs):
+    if sender in muted_models.get():
+        return
+    change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', -1)
+    update_shopping_cart(instance.user_id, instance.recipe_id, -1)
+    bump_version_on_commit(f'shopping_cart:{instance.user_id}')
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if sender in muted_models.get():
+        return
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+    bump_version_on_commit(f'favorites:{instance.user_id}')
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    if sender in muted_models.get():
+        return
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+    bump_version_on_commit(f'favorites:{instance.user_id}')
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.user_id, 'subscribers_count', 1)
+        backfill(instance)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.user_id, 'subscribers_count', -1)
+    remove(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    bump_version_on_commit('recipes')
+    update_search_index([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_version_on_commit('recipes')
+    delete_from_search_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    bump_version_on_commit('recipes')
+    recipe_ids = pk_set or () if reverse else [instance.pk]
+    Recipe.objects.filter(
+        pk__in=recipe_ids,
+    ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=TagInRecipe)
+@receiver(post_delete, sender=TagInRecipe)
+def tag_in_recipe_changed(sender, instance, **kwargs):
+    """
+    Строки тегов, сохранённые по одной (например, в админке),
+    не отправляют m2m_changed
+    """
+    if sender in muted_models.get():
+        return
+    bump_version_on_commit('recipes')
+    Recipe.objects.filter(
+        pk=instance.recipe_id,
+    ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def ingredient_in_recipe_changed(sender, instance, **kwargs):
+    if sender in muted_models.get():
+        return
+    invalidate_recipe(instance.recipe_id)
+    Recipe.objects.filter(
+        pk=instance.recipe_id,
+    ).update(updated_at=timezone.now())
+    update_search_index([instance.recipe_id])
+    bump_version_on_commit(RECIPE_INDEX_NAMESPACE)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    invalidate_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    bump_version_on_commit('ingredients')
+    if not created:
+        update_search_index(IngredientInRecipe.objects.filter(
+            ingredient=instance,
+        ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, **kwargs):
+    bump_version_on_commit('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version_on_commit('tags')
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, update_fields, **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_version_on_commit('users')
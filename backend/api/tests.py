@@ -1,3 +1,605 @@
-# from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from authentication.models import User
+from api.cache import get_or_refresh, get_version
+from api.images import CHUNK_SIZE, StreamingBase64ImageField
+from api.shopping_cart import get_cache_key
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCartItem,
+    Tag,
+    TagInRecipe,
+)
+
+RECIPES_COUNT = 100
+INGREDIENTS_PER_RECIPE = 15
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='password',
+        first_name=username,
+        last_name=username,
+    )
+
+
+def create_recipe(author, amounts, tag=None):
+    """
+    Рецепт с ингредиентами {ингредиент: количество}
+    """
+    recipe = Recipe.objects.create(
+        author=author,
+        name='Рецепт',
+        image='recipes/image.png',
+        text='Описание',
+        cooking_time=10,
+    )
+    if tag is not None:
+        recipe.tags.add(tag)
+    IngredientInRecipe.objects.bulk_create([
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in amounts.items()
+    ])
+    return recipe
+
+
+def download_shopping_cart(client):
+    """
+    Список покупок в формате JSON: {название: количество}
+    """
+    response = client.get(
+        '/api/recipes/download_shopping_cart/', {'format': 'json'}
+    )
+    return {
+        item['name']: item['amount']
+        for item in json.loads(b''.join(response.streaming_content))
+    }
+
+
+def encode_image(color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), color).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class RecipeListQueriesTest(APITestCase):
+    """
+    Число запросов списка рецептов не зависит от размера страницы
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        author = create_user('author')
+        tags = Tag.objects.bulk_create([
+            Tag(name='Завтрак', color='#E26C2D', slug='breakfast'),
+            Tag(name='Обед', color='#49B64E', slug='lunch'),
+        ])
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(INGREDIENTS_PER_RECIPE)
+        ])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                name=f'Рецепт {number}',
+                image='recipes/image.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            for number in range(RECIPES_COUNT)
+        ])
+        TagInRecipe.objects.bulk_create([
+            TagInRecipe(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in tags
+        ])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in ingredients
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::2]
+        ])
+        ShoppingCartItem.objects.bulk_create([
+            ShoppingCartItem(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3]
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        # Словарь тегов (строится заново после очистки кэша), COUNT,
+        # страница с флагами избранного и корзины, ингредиенты и теги
+        # страницы, подписки пользователя
+        for limit in (2, 50):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(6):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_full_page_query_budget(self):
+        """
+        Страница из 100 рецептов по 15 ингредиентов
+        укладывается в те же запросы, что и маленькая
+        """
+        cache.clear()
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/recipes/', {'limit': 100})
+        self.assertEqual(len(response.data['results']), RECIPES_COUNT)
+        for recipe in response.data['results']:
+            self.assertEqual(
+                len(recipe['ingredients']), INGREDIENTS_PER_RECIPE
+            )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ShoppingCartCacheTest(APITestCase):
+    """
+    Закэшированный список покупок изменяется вместе с корзиной и рецептами
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch'
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        cls.soup = create_recipe(
+            cls.user, {cls.salt: 5, cls.sugar: 10}, cls.tag
+        )
+        cls.salad = create_recipe(cls.user, {cls.salt: 3}, cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def download(self):
+        return download_shopping_cart(self.client)
+
+    def cached_totals(self):
+        return cache.get(get_cache_key(self.user.id))
+
+    def change_cart(self, method, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+        self.assertLess(response.status_code, 300)
+
+    def test_add_and_remove_update_cached_totals(self):
+        self.change_cart('post', self.soup)
+        self.assertEqual(self.download(), {'соль': 5, 'сахар': 10})
+        self.change_cart('post', self.salad)
+        self.assertEqual(
+            self.cached_totals(), {('соль', 'г'): 8, ('сахар', 'г'): 10}
+        )
+        self.change_cart('delete', self.soup)
+        self.assertEqual(self.cached_totals(), {('соль', 'г'): 3})
+        self.assertEqual(self.download(), {'соль': 3})
+
+    @mock.patch('api.serializers.schedule_renditions')
+    def test_recipe_ingredients_change_resets_totals(self, schedule):
+        self.change_cart('post', self.soup)
+        self.download()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.soup.id}/',
+                {
+                    'ingredients': [{'id': self.salt.id, 'amount': 7}],
+                    'tags': [self.tag.id],
+                    'image': encode_image(),
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.cached_totals())
+        self.assertEqual(self.download(), {'соль': 7})
+
+    def test_ingredient_rename_changes_cache_key(self):
+        self.change_cart('post', self.soup)
+        self.download()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sugar.name = 'сахарный песок'
+            self.sugar.save()
+        self.assertEqual(
+            self.download(), {'соль': 5, 'сахарный песок': 10}
+        )
+
+    def test_recipe_deletion_removes_its_ingredients(self):
+        self.change_cart('post', self.soup)
+        self.change_cart('post', self.salad)
+        self.download()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/recipes/{self.soup.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.download(), {'соль': 3})
+
+    def test_rolled_back_change_keeps_totals(self):
+        self.change_cart('post', self.soup)
+        totals = self.download()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                ShoppingCartItem.objects.create(
+                    user=self.user, recipe=self.salad
+                )
+                raise ValueError
+        self.assertEqual(
+            self.cached_totals(), {('соль', 'г'): 5, ('сахар', 'г'): 10}
+        )
+        self.assertEqual(self.download(), totals)
+
+
+class RecipeAdminTagsTest(APITestCase):
+    """
+    Теги рецепта редактируются в админке и сбрасывают кэш рецептов
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='password',
+            first_name='admin',
+            last_name='admin',
+        )
+        cls.breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.dinner = Tag.objects.create(
+            name='Ужин', color='#8775D2', slug='dinner'
+        )
+        cls.recipe = create_recipe(cls.admin, {}, cls.breakfast)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_tag_inline_changes_recipe_tags(self):
+        row = TagInRecipe.objects.get(recipe=self.recipe)
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.pk}/change/',
+            {
+                'author': self.admin.pk,
+                'name': self.recipe.name,
+                'text': self.recipe.text,
+                'cooking_time': self.recipe.cooking_time,
+                'taginrecipe_set-TOTAL_FORMS': 2,
+                'taginrecipe_set-INITIAL_FORMS': 1,
+                'taginrecipe_set-0-id': row.pk,
+                'taginrecipe_set-0-recipe': self.recipe.pk,
+                'taginrecipe_set-0-tag': self.breakfast.pk,
+                'taginrecipe_set-0-DELETE': 'on',
+                'taginrecipe_set-1-recipe': self.recipe.pk,
+                'taginrecipe_set-1-tag': self.dinner.pk,
+                'ingredientinrecipe_set-TOTAL_FORMS': 0,
+                'ingredientinrecipe_set-INITIAL_FORMS': 0,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(self.recipe.tags.all()), [self.dinner])
+
+    def test_tag_rows_update_recipe(self):
+        for change in (
+            lambda: TagInRecipe.objects.create(
+                recipe=self.recipe, tag=self.dinner
+            ),
+            lambda: TagInRecipe.objects.get(
+                recipe=self.recipe, tag=self.breakfast
+            ).delete(),
+        ):
+            updated_at = Recipe.objects.get(pk=self.recipe.pk).updated_at
+            version = get_version('recipes')
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertGreater(
+                Recipe.objects.get(pk=self.recipe.pk).updated_at, updated_at
+            )
+            self.assertGreater(get_version('recipes'), version)
+
+
+class GetOrRefreshTest(SimpleTestCase):
+    """
+    Пересборка значения в кэше с блокировкой от одновременной пересборки
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rebuild_releases_only_own_lock(self):
+        cache.set('page', ((1,), 'old'))
+        self.assertEqual(
+            get_or_refresh('page', (time.time_ns(),), lambda: 'new', 60, 60),
+            'new',
+        )
+        self.assertIsNone(cache.get('page:lock'))
+        cache.add('page:lock', True)
+        self.assertEqual(
+            get_or_refresh('page', (2,), lambda: 'newer', 60, 60), 'newer'
+        )
+        self.assertTrue(cache.get('page:lock'))
+
+    def test_stale_value_while_locked(self):
+        cache.set('page', ((1,), 'old'))
+        cache.add('page:lock', True)
+        self.assertEqual(
+            get_or_refresh('page', (time.time_ns(),), lambda: 'new', 60, 60),
+            'old',
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@mock.patch('api.serializers.schedule_renditions')
+class RecipeUpdateTest(APITestCase):
+    """
+    PATCH рецепта меняет только отличающиеся строки и поля
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch'
+        )
+        cls.salt, cls.sugar, cls.pepper, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'перец', 'мука')
+        )
+        cls.recipe = create_recipe(
+            cls.user, {cls.salt: 1, cls.sugar: 2, cls.pepper: 3}, cls.tag
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def patch(self, amounts, color='white'):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient, amount in amounts.items()
+                ],
+                'tags': [self.tag.id],
+                'image': encode_image(color),
+            },
+            format='json',
+        )
+
+    def get_rows(self):
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in IngredientInRecipe.objects.filter(recipe=self.recipe)
+        }
+
+    def get_recipe(self):
+        return Recipe.objects.get(pk=self.recipe.pk)
+
+    def test_patch_inserts_updates_and_deletes_rows(self, schedule):
+        rows = self.get_rows()
+        response = self.patch({self.salt: 1, self.sugar: 5, self.flour: 4})
+        self.assertEqual(response.status_code, 200)
+        amounts = {
+            item['id']: item['amount']
+            for item in response.data['ingredients']
+        }
+        self.assertEqual(
+            amounts, {self.salt.id: 1, self.sugar.id: 5, self.flour.id: 4}
+        )
+        new_rows = self.get_rows()
+        self.assertEqual(
+            set(new_rows), {self.salt.id, self.sugar.id, self.flour.id}
+        )
+        self.assertEqual(new_rows[self.salt.id], rows[self.salt.id])
+        self.assertEqual(new_rows[self.sugar.id], (rows[self.sugar.id][0], 5))
+        self.assertEqual(new_rows[self.flour.id][1], 4)
+
+    def test_unchanged_patch_keeps_recipe_and_rows(self, schedule):
+        amounts = {self.salt: 1, self.sugar: 2, self.pepper: 3}
+        self.patch(amounts)
+        updated_at = self.get_recipe().updated_at
+        rows = self.get_rows()
+        response = self.patch(amounts)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_recipe().updated_at, updated_at)
+        self.assertEqual(self.get_rows(), rows)
+
+    def test_same_image_keeps_renditions(self, schedule):
+        amounts = {self.salt: 1}
+        self.patch(amounts)
+        renditions = {'small': {'webp': 'recipes/small.webp'}}
+        Recipe.objects.filter(pk=self.recipe.pk).update(renditions=renditions)
+        schedule.reset_mock()
+        self.patch(amounts)
+        self.assertEqual(self.get_recipe().renditions, renditions)
+        schedule.assert_not_called()
+        self.patch(amounts, color='black')
+        self.assertEqual(self.get_recipe().renditions, {})
+        schedule.assert_called_once()
+
+
+class StreamingBase64ImageFieldTest(SimpleTestCase):
+    """
+    Потоковое декодирование изображения в base64
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Шум почти не сжимается: данные занимают несколько кусков
+        image = Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        cls.content = buffer.getvalue()
+
+    def decode(self, base64_data):
+        upload = StreamingBase64ImageField().to_internal_value(base64_data)
+        try:
+            return upload.read()
+        finally:
+            upload.close()
+
+    def test_wrapped_payload(self):
+        base64_data = base64.encodebytes(self.content).decode()
+        self.assertGreater(len(base64_data), 2 * CHUNK_SIZE)
+        self.assertEqual(
+            self.decode(f'data:image/png;base64,{base64_data}'),
+            self.content,
+        )
+        self.assertEqual(
+            self.decode(base64_data.replace('\n', '\r\n')), self.content
+        )
+
+    def test_invalid_payload(self):
+        base64_data = base64.b64encode(self.content).decode()
+        for invalid in (base64_data[:-1], base64_data.replace('A', '*', 1)):
+            with self.assertRaises(ValidationError):
+                self.decode(invalid)
+
+
+class BulkChangesTest(APITestCase):
+    """
+    Пакетное изменение избранного и корзины и повтор по Idempotency-Key
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('shopper')
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.soup = create_recipe(cls.user, {cls.salt: 5})
+        cls.salad = create_recipe(cls.user, {cls.salt: 3})
+        cls.missing_id = cls.salad.id + 1
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def change(self, method, url, recipe_ids, idempotency_key=None):
+        headers = {}
+        if idempotency_key is not None:
+            headers['HTTP_IDEMPOTENCY_KEY'] = idempotency_key
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(
+                f'/api/recipes/{url}/',
+                {'recipes': recipe_ids},
+                format='json',
+                **headers,
+            )
+
+    def get_statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {
+            result['id']: result['status']
+            for result in response.data['results']
+        }
+
+    def get_counts(self, counter):
+        return dict(Recipe.objects.values_list('id', counter))
+
+    def assert_bulk_changes(self, url, model, counter):
+        model.objects.create(user=self.user, recipe=self.soup)
+        ids = [self.soup.id, self.salad.id, self.missing_id]
+        self.assertEqual(
+            self.get_statuses(self.change('post', url, ids)),
+            {
+                self.soup.id: 'exists',
+                self.salad.id: 'created',
+                self.missing_id: 'not_found',
+            },
+        )
+        self.assertEqual(
+            self.get_counts(counter), {self.soup.id: 1, self.salad.id: 1}
+        )
+        self.assertEqual(model.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            self.get_statuses(self.change('delete', url, ids)),
+            {
+                self.soup.id: 'deleted',
+                self.salad.id: 'deleted',
+                self.missing_id: 'not_found',
+            },
+        )
+        self.assertEqual(
+            self.get_counts(counter), {self.soup.id: 0, self.salad.id: 0}
+        )
+        self.assertFalse(model.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            self.get_statuses(self.change('delete', url, [self.soup.id])),
+            {self.soup.id: 'not_found'},
+        )
+
+    def test_favorite_in_bulk(self):
+        self.assert_bulk_changes('favorite', Favorite, 'favorites_count')
+
+    def test_shopping_cart_in_bulk(self):
+        self.assert_bulk_changes(
+            'shopping_cart', ShoppingCartItem, 'shopping_cart_count'
+        )
+
+    def test_shopping_cart_in_bulk_resets_shopping_list(self):
+        self.change('post', 'shopping_cart', [self.soup.id])
+        self.assertEqual(download_shopping_cart(self.client), {'соль': 5})
+        self.change('post', 'shopping_cart', [self.salad.id])
+        self.assertIsNone(cache.get(get_cache_key(self.user.id)))
+        self.assertEqual(download_shopping_cart(self.client), {'соль': 8})
+        self.change('delete', 'shopping_cart', [self.soup.id])
+        self.assertIsNone(cache.get(get_cache_key(self.user.id)))
+        self.assertEqual(download_shopping_cart(self.client), {'соль': 3})
+
+    def test_idempotency_key_replays_response(self):
+        ids = [self.soup.id, self.salad.id]
+        first = self.change('post', 'favorite', ids, 'key')
+        self.assertNotIn('Idempotent-Replayed', first)
+        Favorite.objects.filter(user=self.user).delete()
+        replayed = self.change('post', 'favorite', ids, 'key')
+        self.assertEqual(replayed.status_code, 200)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.data, first.data)
+        self.assertFalse(Favorite.objects.filter(user=self.user).exists())
+
+    def test_idempotency_key_with_other_body(self):
+        self.change('post', 'favorite', [self.soup.id], 'key')
+        response = self.change('post', 'favorite', [self.salad.id], 'key')
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('errors', response.data)
+        self.assertFalse(
+            Favorite.objects.filter(recipe=self.salad).exists()
+        )
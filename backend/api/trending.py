@@ -0,0 +1,97 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import Favorite, RecipeTrendingScore, ShoppingCartItem
+
+# Начало отсчёта, к которому приводятся веса событий
+EPOCH = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+DECAY_RATE = math.log(2) / settings.TRENDING_HALF_LIFE
+# Вес события: модель, в которой оно хранится
+WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCartItem, 1.0),
+)
+
+
+def log_add_exp(a, b):
+    """
+    log(exp(a) + exp(b)) без переполнения
+    """
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def event_score(weight, created_at):
+    """
+    Логарифм веса события, приведённого к EPOCH.
+    Вклад события в момент t равен exp(оценка - DECAY_RATE * (t - EPOCH)),
+    множитель одинаков для всех рецептов, поэтому порядок по сумме
+    оценок не меняется со временем и старые оценки не пересчитываются.
+    """
+    elapsed = (created_at - EPOCH).total_seconds()
+    return math.log(weight) + DECAY_RATE * elapsed
+
+
+def collect_scores(start=None, end=None):
+    """
+    Суммарные оценки событий с created_at в полуинтервале [start, end)
+    по рецептам
+    """
+    scores = {}
+    for model, weight in WEIGHTS:
+        events = model.objects.filter(created_at__isnull=False)
+        if start is not None:
+            events = events.filter(created_at__gte=start)
+        if end is not None:
+            events = events.filter(created_at__lt=end)
+        rows = events.values_list('recipe_id', 'created_at')
+        for recipe_id, created_at in rows.iterator(chunk_size=10_000):
+            score = event_score(weight, created_at)
+            if recipe_id in scores:
+                score = log_add_exp(scores[recipe_id], score)
+            scores[recipe_id] = score
+    return scores
+
+
+def save_scores(scores, batch_size=1000):
+    RecipeTrendingScore.objects.bulk_create(
+        [
+            RecipeTrendingScore(recipe_id=recipe_id, score=score)
+            for recipe_id, score in scores.items()
+        ],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=['score'],
+    )
+
+
+def refresh_all(end):
+    """
+    Полный пересчёт оценок по событиям до end.
+    Убирает вклад удалённых из избранного и корзины рецептов.
+    """
+    scores = collect_scores(end=end)
+    with transaction.atomic():
+        RecipeTrendingScore.objects.all().delete()
+        save_scores(scores)
+    return len(scores)
+
+
+def refresh_window(start, end):
+    """
+    Добавляет к оценкам события из окна [start, end)
+    """
+    scores = collect_scores(start, end)
+    with transaction.atomic():
+        existing = RecipeTrendingScore.objects.select_for_update().filter(
+            recipe_id__in=scores,
+        ).values_list('recipe_id', 'score')
+        for recipe_id, score in existing:
+            scores[recipe_id] = log_add_exp(scores[recipe_id], score)
+        save_scores(scores)
+    return len(scores)
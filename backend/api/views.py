@@ -1,10 +1,22 @@
+import hashlib
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (
+    Count,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from djoser.views import UserViewSet as BaseUserViewSet
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from authentication.models import Subscription
 from recipes.models import (
@@ -14,15 +26,41 @@ from recipes.models import (
     IngredientInRecipe,
     Favorite,
     ShoppingCartItem,
+    RecipeTrendingScore,
+)
+from .cache import bump_version_on_commit, get_version
+from .counters import change_counters
+from .feed import fan_out, get_feed_page
+from .ingredient_index import ingredient_index
+from .mixins import (
+    AnonymousCacheMixin,
+    CachedResponseMixin,
+    IdempotencyMixin,
+    SubscribedIdsMixin,
+)
+from .pagination import (
+    CustomCursorPagination,
+    CustomPagination,
+    ListPagination,
+    TrendingCursorPagination,
+)
+from .recipe_index import recipe_index
+from .renderers import (
+    TextShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    JSONShoppingCartRenderer,
 )
-from .pagination import CustomPagination
 from .permissions import IsAuthorOrReadOnly, IsSameUser
+from .shopping_cart import get_shopping_cart, reset_shopping_cart
+from .signals import bulk_changes
 from .serializers import (
+    CookableRecipeSerializer,
     UserSerializer,
     TagSerializer,
     IngredientSerializer,
     RecipeSerializer,
     RecipeInSubscriptionSerializer,
+    RecipeIdsSerializer,
     RecipeWritableSerializer,
     SubscriptionSerializer,
 )
@@ -31,7 +69,7 @@ from .filters import RecipeFilter, IngredientFilter
 User = get_user_model()
 
 
-class UserViewSet(BaseUserViewSet):
+class UserViewSet(SubscribedIdsMixin, BaseUserViewSet):
     pagination_class = CustomPagination
 
     def get_serializer_class(self):
@@ -46,7 +84,7 @@ class UserViewSet(BaseUserViewSet):
         return super().get_serializer_class()
 
     def get_queryset(self):
-        return User.objects.all().prefetch_related('recipes')
+        return User.objects.all()
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -67,12 +105,27 @@ class UserViewSet(BaseUserViewSet):
         Возвращает список подписок
         для авторизованного пользователя
         """
+        recipes = Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit:
+            recipes = recipes[:int(recipes_limit)]
+        recipes_count = Recipe.objects.filter(
+            author=OuterRef('user'),
+        ).order_by().values('author').annotate(
+            count=Count('pk'),
+        ).values('count')
         subscriptions = Subscription.objects.filter(
             subscriber=request.user
         ).select_related(
             'user',
+        ).annotate(
+            recipes_count=Coalesce(Subquery(recipes_count), 0),
         ).prefetch_related(
-            'user__recipes',
+            Prefetch(
+                'user__recipes',
+                queryset=recipes,
+                to_attr='recipes_preview',
+            ),
         )
 
         page = self.paginate_queryset(subscriptions)
@@ -86,6 +139,7 @@ class UserViewSet(BaseUserViewSet):
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
+    @transaction.atomic
     def subscribe(self, request, id=None):
         """
         Подписка/отписка на автора
@@ -119,42 +173,189 @@ class UserViewSet(BaseUserViewSet):
                 status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    cache_namespace = 'tags'
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filterset_class = IngredientFilter
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    cache_namespace = 'ingredients'
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по началу названия обслуживается индексом в памяти
+        """
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(
+            request,
+            lambda request: HttpResponse(
+                ingredient_index.search(name),
+                content_type='application/json',
+            ),
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(
+    AnonymousCacheMixin,
+    IdempotencyMixin,
+    SubscribedIdsMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Recipe.objects.all().select_related(
         'author',
     ).prefetch_related(
-        'ingredients', 'tags',
+        Prefetch(
+            'ingredientinrecipe_set',
+            queryset=IngredientInRecipe.objects.select_related('ingredient'),
+        ),
+        'tags',
     )
     permission_classes = [IsAuthorOrReadOnly]
     serializer_class = RecipeSerializer
     filterset_class = RecipeFilter
+    count_cache_namespace = 'recipes'
+    count_cache_user_filters = {
+        'is_favorited': 'favorites',
+        'is_in_shopping_cart': 'shopping_cart',
+    }
+    anonymous_cache_namespaces = ('recipes', 'tags', 'ingredients', 'users')
+    anonymous_cache_params = ('page', 'limit', 'cursor', 'tags', 'author')
+
+    def get_queryset(self):
+        """
+        Флаги избранного и корзины вычисляются
+        в основном запросе, а не отдельным запросом на каждый рецепт
+        """
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'),
+            )),
+            is_in_shopping_cart=Exists(ShoppingCartItem.objects.filter(
+                user=user, recipe=OuterRef('pk'),
+            )),
+        )
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return RecipeWritableSerializer
         return super().get_serializer_class()
 
+    def get_etag(self, recipes, *extra):
+        """
+        ETag ответа, вычисляемый без сериализации: по времени изменения
+        рецептов, флагам пользователя и версиям связанных справочников
+        """
+        parts = [
+            get_version('ingredients'),
+            get_version('tags'),
+            get_version('users'),
+            *extra,
+        ]
+        for recipe in recipes:
+            parts.append((
+                recipe.id,
+                recipe.updated_at.isoformat(),
+                getattr(recipe, 'is_favorited', False),
+                getattr(recipe, 'is_in_shopping_cart', False),
+                recipe.author_id in self.subscribed_ids,
+            ))
+        return f'"{hashlib.md5(repr(parts).encode()).hexdigest()}"'
+
+    def list(self, request, *args, **kwargs):
+        return self.get_anonymous_cached_response(
+            request, self.get_list_response, *args, **kwargs
+        )
+
+    def get_list_response(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return super().list(request, *args, **kwargs)
+        etag = self.get_etag(page, self.get_paginated_response([]).data)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_etag([instance])
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(instance)
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            recipe = serializer.save(author=self.request.user)
+            fan_out(recipe)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+        Страницы задаются параметром before - id последнего
+        рецепта предыдущей страницы, и limit.
+        """
+        try:
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+            limit = int(request.query_params.get(
+                'limit', CustomCursorPagination.page_size,
+            ))
+        except ValueError:
+            return Response(
+                {"errors": "Параметры before и limit должны быть числами"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, CustomCursorPagination.max_page_size))
+        recipe_ids = get_feed_page(request.user, before, limit)
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        page = [recipes[recipe_id] for recipe_id in recipe_ids
+                if recipe_id in recipes]
+        next_url = None
+        if len(recipe_ids) == limit:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'before', recipe_ids[-1],
+            )
+        serializer = self.get_serializer(page, many=True)
+        return Response({
+            'next': next_url,
+            'results': serializer.data,
+        })
 
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
         """
         Добавление/удаление рецепта из корзины
@@ -198,39 +399,91 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[permissions.IsAuthenticated]
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=[
+            TextShoppingCartRenderer,
+            CSVShoppingCartRenderer,
+            JSONShoppingCartRenderer,
+        ],
     )
     def download_shopping_cart(self, request):
         """
-        Скачивание списка покупок в формате .txt
+        Скачивание списка покупок.
+        Формат выбирается параметром ?format=txt|csv|json,
+        сводный список берётся из кэша и отдаётся потоком.
         """
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user,
-        ).select_related('ingredient').values(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-        ).annotate(
-            amount=Sum('amount')
-        )
-        output = '\n'.join([
-            f'{i["ingredient__name"]} - {i["amount"]}'
-            f'{i["ingredient__measurement_unit"]}'
-            for i in ingredients
-        ])
-        response = HttpResponse(
-            output,
-            content_type='text/plain'
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(get_shopping_cart(request.user)),
+            content_type=renderer.content_type,
         )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.txt"'
+            f'attachment; filename="shopping_cart.{renderer.format}"'
         )
         return response
 
+    @action(
+        detail=False,
+        methods=['get'],
+        pagination_class=ListPagination,
+    )
+    def cookable(self, request):
+        """
+        Рецепты, которые можно приготовить из имеющихся ингредиентов
+        (?ingredients=1&ingredients=2), по убыванию доли
+        ингредиентов рецепта, которые уже есть
+        """
+        try:
+            ingredient_ids = [
+                int(ingredient_id)
+                for ingredient_id in request.query_params.getlist(
+                    'ingredients'
+                )
+            ]
+        except ValueError:
+            return Response(
+                {"errors": "Ингредиенты задаются их id"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page = self.paginate_queryset(recipe_index.rank(ingredient_ids))
+        coverage = dict(page)
+        recipes = self.get_queryset().in_bulk(coverage)
+        page = [recipes[recipe_id] for recipe_id in coverage
+                if recipe_id in recipes]
+        for recipe in page:
+            recipe.coverage = coverage[recipe.id]
+        serializer = CookableRecipeSerializer(
+            page, many=True, context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        pagination_class=TrendingCursorPagination,
+    )
+    def trending(self, request):
+        """
+        Рецепты по убыванию популярности с затуханием во времени.
+        Оценки обновляет команда manage.py trending.
+        Страницы задаются параметрами cursor и limit.
+        """
+        scores = self.paginate_queryset(
+            RecipeTrendingScore.objects.values('recipe_id', 'score')
+        )
+        recipe_ids = [score['recipe_id'] for score in scores]
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        page = [recipes[recipe_id] for recipe_id in recipe_ids
+                if recipe_id in recipes]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk=None):
         """
         Добавление/удаление рецепта из избранного
@@ -272,3 +525,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 {"errors": "Рецепта нет в избранном"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+    @transaction.atomic
+    def change_in_bulk(self, request, model, counter):
+        """
+        Пакетное добавление (POST) или удаление (DELETE) рецептов
+        из избранного или корзины: один INSERT или один DELETE.
+        Сигналы строк при этом не обрабатываются, поэтому счётчики
+        и версии кэша обновляются здесь же, один раз на весь пакет.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(
+            serializer.validated_data['recipes']
+        ))
+        user = request.user
+        present_ids = set(model.objects.filter(
+            user=user, recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', flat=True))
+        if request.method == 'POST':
+            existing_ids = set(Recipe.objects.filter(
+                pk__in=recipe_ids,
+            ).values_list('id', flat=True))
+            changed_ids = [
+                recipe_id for recipe_id in recipe_ids
+                if recipe_id in existing_ids and recipe_id not in present_ids
+            ]
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=recipe_id)
+                 for recipe_id in changed_ids],
+                ignore_conflicts=True,
+            )
+            statuses = {
+                recipe_id: 'created' for recipe_id in changed_ids
+            } | {
+                recipe_id: 'exists' for recipe_id in present_ids
+            }
+            delta = 1
+        else:
+            changed_ids = [
+                recipe_id for recipe_id in recipe_ids
+                if recipe_id in present_ids
+            ]
+            with bulk_changes(model):
+                model.objects.filter(
+                    user=user, recipe_id__in=changed_ids,
+                ).delete()
+            statuses = {recipe_id: 'deleted' for recipe_id in changed_ids}
+            delta = -1
+        if changed_ids:
+            change_counters(Recipe, changed_ids, counter, delta)
+            if model is ShoppingCartItem:
+                transaction.on_commit(lambda: reset_shopping_cart(user.id))
+                bump_version_on_commit(f'shopping_cart:{user.id}')
+            else:
+                bump_version_on_commit(f'favorites:{user.id}')
+        return Response({
+            'results': [
+                {
+                    'id': recipe_id,
+                    'status': statuses.get(recipe_id, 'not_found'),
+                }
+                for recipe_id in recipe_ids
+            ],
+        })
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='favorite',
+    )
+    def favorite_in_bulk(self, request):
+        """
+        Пакетное добавление/удаление рецептов из избранного.
+        Тело запроса: {"recipes": [id, ...]}, ответ - статус каждого id.
+        Поддерживает заголовок Idempotency-Key для безопасных повторов.
+        """
+        return self.get_idempotent_response(
+            request, self.change_in_bulk, Favorite, 'favorites_count',
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='shopping_cart',
+    )
+    def shopping_cart_in_bulk(self, request):
+        """
+        Пакетное добавление/удаление рецептов из корзины.
+        Тело запроса: {"recipes": [id, ...]}, ответ - статус каждого id.
+        Поддерживает заголовок Idempotency-Key для безопасных повторов.
+        """
+        return self.get_idempotent_response(
+            request,
+            self.change_in_bulk,
+            ShoppingCartItem,
+            'shopping_cart_count',
+        )
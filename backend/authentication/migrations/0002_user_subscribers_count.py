@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_subscribers_count(apps, schema_editor):
+    User = apps.get_model('authentication', 'User')
+    Subscription = apps.get_model('authentication', 'Subscription')
+    User.objects.update(subscribers_count=Coalesce(Subquery(
+        Subscription.objects.filter(
+            user=OuterRef('pk'),
+        ).order_by().values('user').annotate(
+            count=Count('pk'),
+        ).values('count')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.RunPython(fill_subscribers_count, migrations.RunPython.noop),
+    ]
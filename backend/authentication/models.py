@@ -16,6 +16,11 @@ class User(AbstractUser):
         max_length=150,
         verbose_name='Фамилия'
     )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
 
     REQUIRED_FIELDS = [
         'username',
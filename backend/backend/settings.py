@@ -91,6 +91,18 @@ DATABASES = {
     }
 }
 
+# Кэш должен быть общим для всех процессов и поддерживать атомарный add
+# (Redis, Memcached, база данных). LocMemCache - только для разработки.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
@@ -148,6 +160,20 @@ MEDIA_URL = 'media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Уменьшенные копии изображений рецептов строятся в фоновых потоках
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Период полураспада популярности рецептов в секундах.
+# После изменения оценки нужно пересчитать: manage.py trending --once
+TRENDING_HALF_LIFE = int(os.getenv('TRENDING_HALF_LIFE', 60 * 60 * 24))
+
+# Рецепты авторов, у которых при публикации подписчиков больше
+# FEED_FANOUT_LIMIT, не раскладываются по лентам, а добавляются в ленту
+# при чтении.
+# При подписке в ленту попадают FEED_BACKFILL последних рецептов автора.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 100))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
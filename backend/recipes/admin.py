@@ -7,6 +7,7 @@ from .models import (
     Favorite,
     IngredientInRecipe,
     ShoppingCartItem,
+    TagInRecipe,
 )
 
 
@@ -20,6 +21,11 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
 
 
+class TagInRecipeInline(admin.TabularInline):
+    model = TagInRecipe
+    extra = 1
+
+
 class IngredientInRecipeInline(admin.TabularInline):
     model = IngredientInRecipe
     extra = 1
@@ -29,7 +35,7 @@ class IngredientInRecipeInline(admin.TabularInline):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author',)
     list_filter = ('author', 'tags',)
-    inlines = (IngredientInRecipeInline,)
+    inlines = (TagInRecipeInline, IngredientInRecipeInline)
 
 
 @admin.register(Favorite)
@@ -0,0 +1,336 @@
+import base64
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Prefetch, Q
+from django.db.models.functions import Cast
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import bump_version
+from api.filters import RecipeFilter
+from api.ingredient_index import IngredientIndex
+from api.recipe_index import RecipeIngredientIndex
+from api.serializers import IngredientSerializer, RecipeWritableSerializer
+from authentication.models import User
+from recipes.models import (
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    Tag,
+    TagInRecipe,
+)
+from .setupdb import DEFAULT_PATH, read_json
+
+BATCH_SIZE = 5000
+
+
+def measure(function, repeat):
+    """
+    Среднее время выполнения function в миллисекундах
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеры производительности. Данные для замеров создаются '
+        'в транзакции, которая затем откатывается.'
+    )
+    benchmarks = ('ingredients', 'tags', 'update', 'cookable')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmark',
+            choices=self.benchmarks,
+            help='Что замерять',
+        )
+        parser.add_argument(
+            '--repeat',
+            default=10,
+            type=int,
+            help='Сколько раз повторять каждый замер',
+        )
+        parser.add_argument(
+            '--recipes',
+            default=100_000,
+            type=int,
+            help='Сколько рецептов создать для замера',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            getattr(self, f'benchmark_{options["benchmark"]}')(options)
+            transaction.set_rollback(True)
+
+    def report(self, name, milliseconds):
+        self.stdout.write(f'{name}: {milliseconds:.3f} мс')
+
+    def measure_queries(self, name, function, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        self.report(
+            f'{name} ({len(queries)} запросов)',
+            measure(function, repeat),
+        )
+
+    def create_recipes(self, count):
+        author = User.objects.create_user(
+            username='benchmark',
+            email='benchmark@example.com',
+            first_name='benchmark',
+            last_name='benchmark',
+        )
+        recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {number}',
+                    image='recipes/benchmark.png',
+                    text='Описание',
+                    cooking_time=10,
+                )
+                for number in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        self.stdout.write(f'Рецептов: {count}')
+        return recipes
+
+    def benchmark_ingredients(self, options):
+        """
+        Поиск ингредиентов по началу названия: индекс в памяти
+        против istartswith и сериализации всех найденных строк
+        """
+        with open(DEFAULT_PATH, encoding='utf-8') as file:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in read_json(file)
+                ],
+                ignore_conflicts=True,
+            )
+        names = Ingredient.objects.values_list('name', flat=True)
+        prefixes = sorted(
+            {name[:1] for name in names} | {name[:2] for name in names}
+        )
+        self.stdout.write(
+            f'Ингредиентов: {len(names)}, префиксов: {len(prefixes)}'
+        )
+        renderer = JSONRenderer()
+        index = IngredientIndex()
+        repeat = options['repeat']
+
+        def search_orm():
+            for prefix in prefixes:
+                renderer.render(IngredientSerializer(
+                    Ingredient.objects.filter(name__istartswith=prefix),
+                    many=True,
+                ).data)
+
+        def search_index():
+            for prefix in prefixes:
+                index.search(prefix)
+
+        self.report('Построение индекса', measure(index.index.build, 1))
+        index.search('')
+        self.report(
+            'ORM, на префикс',
+            measure(search_orm, repeat) / len(prefixes),
+        )
+        self.report(
+            'Индекс, на префикс',
+            measure(search_index, repeat) / len(prefixes),
+        )
+
+    def benchmark_tags(self, options):
+        """
+        Фильтр рецептов по тегам: EXISTS по индексу (tag_id, recipe_id)
+        против соединения с тегами и DISTINCT.
+        У каждого рецепта от одного до трёх из пяти тегов.
+        """
+        rng = random.Random(0)
+        tags = Tag.objects.bulk_create([
+            Tag(
+                name=f'Тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(5)
+        ])
+        recipes = self.create_recipes(options['recipes'])
+        TagInRecipe.objects.bulk_create(
+            [
+                TagInRecipe(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in rng.sample(tags, rng.randint(1, 3))
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        bump_version('tags')
+        repeat = options['repeat']
+        for tags_count in (1, 2, 5):
+            slugs = [tag.slug for tag in tags[:tags_count]]
+            data = QueryDict(mutable=True)
+            data.setlist('tags', slugs)
+
+            def join():
+                list(Tag.objects.filter(slug__in=slugs))
+                queryset = Recipe.objects.filter(
+                    tags__slug__in=slugs,
+                ).distinct()
+                queryset.count()
+                list(queryset[:6])
+
+            def exists():
+                queryset = RecipeFilter(
+                    data, queryset=Recipe.objects.all(),
+                ).qs
+                queryset.count()
+                list(queryset[:6])
+
+            self.report(
+                f'Тегов {tags_count}, соединение и DISTINCT',
+                measure(join, repeat),
+            )
+            self.report(
+                f'Тегов {tags_count}, EXISTS', measure(exists, repeat),
+            )
+
+    def benchmark_update(self, options):
+        """
+        Стоимость PATCH рецепта в зависимости от числа ингредиентов:
+        без изменения состава, с изменением одного количества
+        и с заменой одного ингредиента
+        """
+        tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(101)
+        ])
+        buffer = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+        repeat = options['repeat']
+        sizes = (5, 15, 50, 100)
+        for size, recipe in zip(sizes, self.create_recipes(len(sizes))):
+            recipe.tags.add(tag)
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1,
+                )
+                for ingredient in ingredients[:size]
+            ])
+            recipes = Recipe.objects.prefetch_related(
+                Prefetch(
+                    'ingredientinrecipe_set',
+                    queryset=IngredientInRecipe.objects.select_related(
+                        'ingredient',
+                    ),
+                ),
+                'tags',
+            )
+            amounts = iter(range(2, 10 ** 6))
+
+            def update(replace=0, change_amount=False):
+                amount = next(amounts) if change_amount else 1
+                items = [
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient in ingredients[replace:size + replace]
+                ]
+                serializer = RecipeWritableSerializer(
+                    recipes.get(pk=recipe.pk),
+                    data={
+                        'ingredients': items,
+                        'tags': [tag.id],
+                        'image': image,
+                        'cooking_time': 15,
+                    },
+                    partial=True,
+                )
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+            self.stdout.write(f'Ингредиентов в рецепте: {size}')
+            self.measure_queries('Без изменения состава', update, repeat)
+            self.measure_queries(
+                'Изменено количество',
+                lambda: update(change_amount=True),
+                repeat,
+            )
+            replaced = iter(range(1, 10 ** 6))
+            self.measure_queries(
+                'Заменён один ингредиент',
+                lambda: update(replace=next(replaced) % 2),
+                repeat,
+            )
+        # Файл изображения сохраняется вне транзакции
+        recipe.image.storage.delete(recipes.get(pk=recipe.pk).image.name)
+
+    def benchmark_cookable(self, options):
+        """
+        Подбор рецептов по имеющимся ингредиентам: инвертированный индекс
+        против GROUP BY по ингредиентам рецептов.
+        В каждом рецепте от 3 до 15 из 2000 ингредиентов.
+        """
+        rng = random.Random(0)
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(2000)
+        ])
+        recipes = self.create_recipes(options['recipes'])
+        IngredientInRecipe.objects.bulk_create(
+            (
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1,
+                )
+                for recipe in recipes
+                for ingredient in rng.sample(ingredients, rng.randint(3, 15))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        index = RecipeIngredientIndex()
+        repeat = options['repeat']
+        self.report('Построение индекса', measure(index.index.get, 1))
+        ingredient_ids = [ingredient.id for ingredient in ingredients]
+        for count in (5, 20, 50):
+            chosen_ids = rng.sample(ingredient_ids, count)
+
+            def group_by():
+                list(Recipe.objects.annotate(
+                    matches=Count(
+                        'ingredientinrecipe',
+                        filter=Q(
+                            ingredientinrecipe__ingredient_id__in=chosen_ids,
+                        ),
+                    ),
+                    total=Count('ingredientinrecipe'),
+                ).filter(matches__gt=0).annotate(
+                    coverage=Cast(F('matches'), FloatField()) / F('total'),
+                ).order_by(
+                    '-coverage', '-matches', '-id',
+                ).values_list('id', 'coverage')[:6])
+
+            self.report(
+                f'Ингредиентов {count}, GROUP BY', measure(group_by, repeat),
+            )
+            self.report(
+                f'Ингредиентов {count}, индекс',
+                measure(lambda: index.rank(chosen_ids)[:6], repeat),
+            )
+        recipe = recipes[0]
+        self.report(
+            'Изменение состава рецепта в индексе',
+            measure(
+                lambda: index.set_recipe(recipe.pk, ingredient_ids[:10]),
+                repeat,
+            ),
+        )
@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.storage import image_storage
+
+
+class Command(BaseCommand):
+    help = 'Удаление изображений, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены',
+        )
+        parser.add_argument(
+            '--min-age',
+            default=60 * 60,
+            type=int,
+            help='Не трогать файлы моложе заданного числа секунд: '
+                 'они могут принадлежать ещё не сохранённому рецепту',
+        )
+
+    def get_referenced_names(self):
+        names = set()
+        recipes = Recipe.objects.values_list('image', 'renditions')
+        for image, renditions in recipes.iterator():
+            names.add(image)
+            for formats in renditions.values():
+                names.update(formats.values())
+        return names
+
+    def handle(self, *args, **options):
+        referenced = self.get_referenced_names()
+        threshold = time.time() - options['min_age']
+        root = image_storage.path(image_storage.prefix)
+        removed = 0
+        freed = 0
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, image_storage.location)
+                name = name.replace(os.sep, '/')
+                stat = os.stat(path)
+                if name in referenced or stat.st_mtime > threshold:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    os.remove(path)
+                removed += 1
+                freed += stat.st_size
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {freed // 1024} КБ'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного, корзины и подписчиков'
+
+    def handle(self, *args, **options):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(f'{counter}: исправлено строк {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import PROCESS_LOCAL_WARNING, is_process_local
+from api.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построение уменьшенных копий изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии и для рецептов, у которых они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(renditions={})
+        processed = 0
+        for recipe_id, name in list(recipes.values_list('id', 'image')):
+            try:
+                build_renditions(recipe_id, name)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии изображений построены для рецептов: {processed}'
+        ))
+        if processed and is_process_local():
+            self.stderr.write(self.style.WARNING(PROCESS_LOCAL_WARNING))
@@ -1,21 +1,110 @@
+import csv
 import json
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import (
+    PROCESS_LOCAL_WARNING, bump_version, is_process_local,
+)
 from recipes.models import Ingredient
 
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / 'data' / 'ingredients.json'
+CHUNK_SIZE = 64 * 1024
+
+
+def read_json(file):
+    """
+    Потоковый разбор JSON-массива объектов без загрузки файла целиком
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Файл должен содержать JSON-массив')
+    position = 1
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ', \t\r\n':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON')
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+READERS = {
+    'json': read_json,
+    'csv': read_csv,
+}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из json-файла'
-
-    def handle(self, *args, **kwargs):
-        with open('../data/ingredients.json', encoding='utf-8') as file:
-            data = json.load(file)
-            for ingredient in data:
-                Ingredient.objects.get_or_create(
-                    name=ingredient['name'],
-                    measurement_unit=ingredient['measurement_unit'],
-                )
-                self.stdout.write(
-                    "Ингредиент {} добавлен".format(ingredient['name'])
+    help = 'Загрузка ингредиентов из json- или csv-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            type=Path,
+            help='Путь к файлу с ингредиентами',
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Количество ингредиентов в одном запросе к базе',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        initial_count = Ingredient.objects.count()
+        processed = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = READERS[file_format](file)
+            while batch := list(islice(rows, batch_size)):
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(
+                            name=name,
+                            measurement_unit=measurement_unit,
+                        )
+                        for name, measurement_unit in batch
+                    ],
+                    ignore_conflicts=True,
                 )
-        self.stdout.write(self.style.SUCCESS('Данные ингредиентов загружены.'))
+                processed += len(batch)
+                self.stdout.write(f'Обработано ингредиентов: {processed}')
+        bump_version('ingredients')
+        created = Ingredient.objects.count() - initial_count
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные ингредиентов загружены. Добавлено новых: {created}.'
+        ))
+        if is_process_local():
+            self.stderr.write(self.style.WARNING(PROCESS_LOCAL_WARNING))
@@ -0,0 +1,55 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.trending import refresh_all, refresh_window
+
+
+class Command(BaseCommand):
+    help = 'Обновление оценок популярности рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Только пересчитать оценки заново и завершиться',
+        )
+        parser.add_argument(
+            '--interval',
+            default=60,
+            type=int,
+            help='Длина окна инкрементального обновления в секундах',
+        )
+        parser.add_argument(
+            '--full-every',
+            default=60,
+            type=int,
+            help='Через сколько окон пересчитывать оценки заново',
+        )
+        parser.add_argument(
+            '--lag',
+            default=5,
+            type=int,
+            help='Отставание окна от текущего времени в секундах, '
+                 'чтобы успели зафиксироваться транзакции',
+        )
+
+    def handle(self, *args, **options):
+        lag = timedelta(seconds=options['lag'])
+        windows = 0
+        start = timezone.now() - lag
+        count = refresh_all(start)
+        self.stdout.write(f'Оценки пересчитаны для рецептов: {count}')
+        while not options['once']:
+            time.sleep(options['interval'])
+            end = timezone.now() - lag
+            windows += 1
+            if windows % options['full_every'] == 0:
+                count = refresh_all(end)
+                self.stdout.write(f'Оценки пересчитаны для рецептов: {count}')
+            else:
+                count = refresh_window(start, end)
+                self.stdout.write(f'Оценки обновлены для рецептов: {count}')
+            start = end
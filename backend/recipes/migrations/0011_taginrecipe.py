@@ -0,0 +1,43 @@
+# Generated by Django 4.2.6 on 2026-10-18 18:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_unique_ingredient'),
+    ]
+
+    operations = [
+        # Таблица recipes_recipe_tags уже существует как автоматическая
+        # промежуточная таблица, поэтому меняется только состояние моделей.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='TagInRecipe',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe', verbose_name='Рецепт')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.tag', verbose_name='Тег')),
+                    ],
+                    options={
+                        'verbose_name': 'Тег рецепта',
+                        'verbose_name_plural': 'Теги рецепта',
+                        'db_table': 'recipes_recipe_tags',
+                        'unique_together': {('recipe', 'tag')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='tags',
+                    field=models.ManyToManyField(through='recipes.TagInRecipe', to='recipes.tag', verbose_name='Теги'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taginrecipe',
+            index=models.Index(fields=['tag', 'recipe'], name='recipe_tags_tag_recipe_idx'),
+        ),
+    ]
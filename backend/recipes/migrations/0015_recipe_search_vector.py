@@ -0,0 +1,78 @@
+# Generated by Django 4.2.6 on 2026-10-18 18:59
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    """
+    CREATE INDEX recipe_search_vector_idx
+    ON recipes_recipe USING gin (search_vector)
+    """,
+    """
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector('russian', recipe.name), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientinrecipe AS item
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = item.ingredient_id
+            WHERE item.recipe_id = recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', recipe.text), 'C')
+    """,
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+]
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, ingredients, text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+    SELECT recipe.id, recipe.name, (
+        SELECT group_concat(ingredient.name, ' ')
+        FROM recipes_ingredientinrecipe AS item
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = item.ingredient_id
+        WHERE item.recipe_id = recipe.id
+    ), recipe.text
+    FROM recipes_recipe AS recipe
+    """,
+]
+SQLITE_BACKWARD = [
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+]
+
+
+def run_for_vendor(postgresql, sqlite):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': postgresql,
+            'sqlite': sqlite,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_alter_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRESQL_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRESQL_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
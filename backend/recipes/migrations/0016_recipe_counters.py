@@ -0,0 +1,45 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for field, related_model in (
+        ('favorites_count', apps.get_model('recipes', 'Favorite')),
+        ('shopping_cart_count', apps.get_model('recipes', 'ShoppingCartItem')),
+    ):
+        Recipe.objects.update(**{field: Coalesce(Subquery(
+            related_model.objects.filter(
+                recipe=OuterRef('pk'),
+            ).order_by().values('recipe').annotate(
+                count=Count('pk'),
+            ).values('count')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном у пользователей'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзине у пользователей'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
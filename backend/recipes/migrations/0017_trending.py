@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_counters'),
+    ]
+
+    operations = [
+        # Время добавления существующих строк неизвестно, они остаются NULL
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='Дата добавления'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, null=True, verbose_name='Дата добавления'),
+        ),
+        # Время добавления существующих строк неизвестно, они остаются NULL
+        migrations.AddField(
+            model_name='shoppingcartitem',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='Дата добавления'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcartitem',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, null=True, verbose_name='Дата добавления'),
+        ),
+        migrations.CreateModel(
+            name='RecipeTrendingScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(verbose_name='Оценка популярности')),
+            ],
+            options={
+                'verbose_name': 'Популярность рецепта',
+                'verbose_name_plural': 'Популярность рецептов',
+                'indexes': [models.Index(fields=['-score', '-recipe'], name='recipe_trending_score_idx')],
+            },
+        ),
+    ]
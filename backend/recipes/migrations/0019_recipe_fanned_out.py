@@ -0,0 +1,40 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def mark_not_fanned_out(apps, schema_editor):
+    """
+    Рецепты авторов с подписчиками, которых нет ни в одной ленте,
+    не были разложены по лентам: автор был крупным при публикации
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    Subscription = apps.get_model('authentication', 'Subscription')
+    Recipe.objects.filter(
+        Exists(Subscription.objects.filter(user=OuterRef('author'))),
+    ).exclude(
+        Exists(FeedItem.objects.filter(recipe=OuterRef('pk'))),
+    ).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_user_subscribers_count'),
+        ('recipes', '0018_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Разложен по лентам подписчиков'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-id'], name='recipe_not_fanned_out_idx'),
+        ),
+        migrations.RunPython(mark_not_fanned_out, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MinLengthValidator
+from django.utils import timezone
+
+from .storage import image_storage
 
 User = get_user_model()
 
@@ -46,6 +50,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
 
 class IngredientInRecipe(models.Model):
@@ -78,6 +88,34 @@ class IngredientInRecipe(models.Model):
         return f'{self.ingredient} в {self.recipe}'
 
 
+class TagInRecipe(models.Model):
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        verbose_name='Тег'
+    )
+    recipe = models.ForeignKey(
+        'recipes.Recipe',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        db_table = 'recipes_recipe_tags'
+        verbose_name = 'Тег рецепта'
+        verbose_name_plural = 'Теги рецепта'
+        unique_together = ('recipe', 'tag')
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipe_tags_tag_recipe_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.tag} в {self.recipe}'
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -90,8 +128,15 @@ class Recipe(models.Model):
         verbose_name='Название'
     )
     image = models.ImageField(
+        storage=image_storage,
         verbose_name='Изображение'
     )
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -100,18 +145,54 @@ class Recipe(models.Model):
         verbose_name='Ингредиенты'
     )
     tags = models.ManyToManyField(
-        Tag,
+        Tag, through=TagInRecipe,
         verbose_name='Теги'
     )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         validators=[MinValueValidator(1)],
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном у пользователей'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзине у пользователей'
+    )
+    fanned_out = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Разложен по лентам подписчиков'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            # Рецепты, которые добавляются в ленты при чтении
+            models.Index(
+                fields=['author', '-id'],
+                condition=models.Q(fanned_out=False),
+                name='recipe_not_fanned_out_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -130,6 +211,12 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        null=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -158,6 +245,12 @@ class ShoppingCartItem(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        null=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Элемент списка покупок'
@@ -171,3 +264,79 @@ class ShoppingCartItem(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class RecipeTrendingScore(models.Model):
+    """
+    Популярность рецепта с экспоненциальным затуханием во времени.
+    Хранится логарифм суммы весов добавлений в избранное и корзину,
+    приведённых к началу отсчёта, поэтому со временем не пересчитывается.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Оценка популярности'
+    )
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(
+                fields=['-score', '-recipe'],
+                name='recipe_trending_score_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score}'
+
+
+class FeedItem(models.Model):
+    """
+    Рецепт в ленте подписчика автора.
+    Строки пишутся при публикации рецепта (fan-out on write).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item'
+            )
+        ]
+        # Ограничение unique_feed_item служит и индексом для чтения ленты
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_item_user_author_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
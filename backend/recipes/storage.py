@@ -0,0 +1,45 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, в котором имя файла - sha256 его содержимого:
+    <prefix>/<первые два символа хэша>/<хэш><расширение>.
+    Одинаковые файлы хранятся один раз, повторная загрузка
+    не пишет на диск, а ссылки на файлы никогда не меняют содержимое.
+    """
+
+    def __init__(self, prefix='recipes', **kwargs):
+        self.prefix = prefix
+        super().__init__(**kwargs)
+
+    def get_digest_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.prefix}/{digest[:2]}/{digest}{extension}'
+
+    def _save(self, name, content):
+        name = self.get_digest_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения защищает файл от gcmedia,
+            # пока рецепт, который на него сошлётся, не сохранён
+            os.utime(self.path(name))
+            return name
+        # Файл пишется под временным именем и атомарно переименовывается,
+        # поэтому недописанный файл никогда не виден под именем хэша
+        temporary_name = f'{name}.{uuid.uuid4().hex}.tmp'
+        temporary_name = super()._save(temporary_name, content)
+        os.replace(self.path(temporary_name), self.path(name))
+        return name
+
+
+image_storage = ContentAddressedStorage()